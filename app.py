@@ -1,25 +1,54 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, send_from_directory
+from flask import Flask, Response, g, has_request_context, render_template, request, redirect, url_for, jsonify, send_from_directory
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime, timedelta
+from sqlalchemy.dialects.postgresql import insert
+from datetime import datetime
 import pytz
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import logging
 import mimetypes
+from heapq import nlargest
+from operator import itemgetter
 import time
-from enrollment_processors import (
-    process_daily_enrollments, process_leadsource_data,
-    process_initial_payments, process_admin_monthly_revenue,
-    process_enrollments_per_opener, process_monthly_revenue_enrollments
-)
+import orjson
+import redis
+from enrollment_processors import process_all, PACIFIC
 
 mimetypes.add_type('video/mp4', '.mp4')
 mimetypes.add_type('video/webm', '.webm')
 mimetypes.add_type('video/ogg', '.ogg')
 
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider that (de)serializes with orjson instead of the stdlib json module."""
+
+    def _options(self):
+        options = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self._options()),
+            mimetype=self.mimetype
+        )
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.config['SECRET_KEY'] = os.urandom(24)
 
 # Update database configuration to use environment variables
@@ -28,29 +57,84 @@ if db_url and db_url.startswith('postgres://'):
     db_url = db_url.replace('postgres://', 'postgresql://', 1)
 app.config['SQLALCHEMY_DATABASE_URI'] = db_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+if db_url and db_url.startswith('postgresql://'):
+    # Validate pooled connections before use and recycle them before the server drops idle ones
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_pre_ping': True,
+        'pool_size': 10,
+        'max_overflow': 20,
+        'pool_recycle': 280,
+        'pool_timeout': 10
+    }
 
 db = SQLAlchemy(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
+# Debug mode and debug logging are opt-in, e.g. FLASK_DEBUG=1 in the dev workflow
+DEBUG = os.environ.get('FLASK_DEBUG') == '1'
+
 # Configure logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=logging.DEBUG if DEBUG else logging.INFO)
 logger = logging.getLogger(__name__)
 
 WEBHOOK_URL = 'https://public-webhook-receiver-juy917.replit.app/get_webhooks'
 MAX_RETRIES = 3
 RETRY_DELAY = 1
 WEBHOOK_TIMEOUT = 30
+GOAL_CACHE_TTL = 30
+DEFAULT_MONTHLY_GOAL = 120
+VIDEO_CACHE_MAX_AGE = 86400
+
+# Shared webhook cache so every worker reuses a single upstream fetch
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+WEBHOOK_CACHE_TTL = int(os.environ.get('WEBHOOK_CACHE_TTL', 30))
+WEBHOOK_REFRESH_INTERVAL = int(os.environ.get('WEBHOOK_REFRESH_INTERVAL', 10))
+WEBHOOK_CACHE_KEY = 'webhook:raw'
+WEBHOOK_STALE_KEY = 'webhook:raw:stale'
+WEBHOOK_PARSED_KEY = 'webhook:parsed:{}'
+LAST_DEMOS_KEY = 'last_demos'
+# Seconds to skip Redis after a failed call before trying it again
+REDIS_RETRY_INTERVAL = 30
+
+redis_pool = redis.ConnectionPool.from_url(REDIS_URL, socket_timeout=1, socket_connect_timeout=1)
+redis_client = redis.Redis(connection_pool=redis_pool)
+
+# Reuse keep-alive connections to the webhook receiver; urllib3 handles retries
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(total=MAX_RETRIES, backoff_factor=RETRY_DELAY, status_forcelist=[502, 503, 504])
+))
+_SESSION.headers.update({'Accept-Encoding': 'gzip'})
+
+# (goal, expiry) for the latest MonthlyGoal, refreshed every GOAL_CACHE_TTL seconds
+_goal_cache = None
 
 class MonthlyGoal(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    goal = db.Column(db.Integer, nullable=False, default=120)
+    goal = db.Column(db.Integer, nullable=False, default=DEFAULT_MONTHLY_GOAL)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     @classmethod
     def get_current_goal(cls):
+        now = time.monotonic()
+        if _goal_cache and now < _goal_cache[1]:
+            return _goal_cache[0]
+
         current_goal = cls.query.order_by(cls.updated_at.desc()).first()
-        return current_goal.goal if current_goal else 120
+        goal = current_goal.goal if current_goal else DEFAULT_MONTHLY_GOAL
+        cls.cache_goal(goal)
+        return goal
+
+    @staticmethod
+    def cache_goal(goal):
+        global _goal_cache
+        _goal_cache = (goal, time.monotonic() + GOAL_CACHE_TTL)
+
+# Single-admin app: argon2id tuned to verify in well under 50ms on one core
+password_hasher = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -58,14 +142,24 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(128))
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
-        logger.debug(f"Password hash set: {self.password_hash}")
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        result = check_password_hash(self.password_hash, password)
+        if self.password_hash.startswith('$argon2'):
+            try:
+                result = password_hasher.verify(self.password_hash, password)
+            except (VerificationError, InvalidHashError):
+                result = False
+        else:
+            # Hashes created by werkzeug before the switch to argon2
+            result = check_password_hash(self.password_hash, password)
         logger.debug(f"Password check result: {result}")
         return result
 
+    def password_needs_rehash(self):
+        return (not self.password_hash.startswith('$argon2')
+                or password_hasher.check_needs_rehash(self.password_hash))
+
     @classmethod
     def get_admin(cls):
         admin = cls.query.filter_by(username='admin').first()
@@ -82,55 +176,183 @@ class SalesData(db.Model):
 def load_user(user_id):
     return User.query.get(int(user_id))
 
-last_processed_officer = None
+# Process-local copy of the last seen demos per officer, used when Redis is unavailable
 last_sale_timestamp = {}
-webhook_last_success = None
-webhook_cache = None
-webhook_cache_duration = timedelta(seconds=5)
 
-def fetch_webhook_data():
-    global webhook_last_success, webhook_cache
-    
-    current_time = datetime.now()
-    
-    # Return cached data if still valid
-    if webhook_cache and webhook_last_success:
-        if current_time - webhook_last_success < webhook_cache_duration:
-            logger.debug("Returning cached webhook data")
-            return webhook_cache
+# Process-local copy of every cache write, {key: (value, expiry or None)},
+# served when Redis is unreachable or has lost the key
+_local_cache = {}
+_redis_retry_at = 0.0
+
+def redis_available():
+    return time.monotonic() >= _redis_retry_at
 
-    session = requests.Session()
-    session.mount('https://', requests.adapters.HTTPAdapter(max_retries=MAX_RETRIES))
+def mark_redis_down(action, key, error):
+    global _redis_retry_at
+    _redis_retry_at = time.monotonic() + REDIS_RETRY_INTERVAL
+    logger.warning(f"Redis {action} failed for {key}, using local cache for {REDIS_RETRY_INTERVAL}s: {str(error)}")
 
-    for attempt in range(MAX_RETRIES):
+def local_cache_get(key):
+    entry = _local_cache.get(key)
+    if entry and (entry[1] is None or time.monotonic() < entry[1]):
+        return entry[0]
+    return None
+
+def local_cache_set(key, value, ttl=None):
+    _local_cache[key] = (value, time.monotonic() + ttl if ttl else None)
+
+def cache_get(key):
+    if redis_available():
         try:
-            logger.info(f"Fetching webhook data (attempt {attempt + 1}/{MAX_RETRIES})")
-            response = session.get(WEBHOOK_URL, timeout=WEBHOOK_TIMEOUT)
-            response.raise_for_status()
-            
-            webhook_cache = response.json()
-            webhook_last_success = current_time
-            
-            logger.info(f"Successfully fetched webhook data. Status code: {response.status_code}")
-            return webhook_cache
-
-        except requests.exceptions.Timeout as e:
-            logger.error(f"Timeout error on attempt {attempt + 1}: {str(e)}")
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Request error on attempt {attempt + 1}: {str(e)}")
-        except ValueError as e:
-            logger.error(f"JSON decode error on attempt {attempt + 1}: {str(e)}")
-        
-        if attempt < MAX_RETRIES - 1:
-            time.sleep(RETRY_DELAY * (attempt + 1))  # Exponential backoff
-
-    if webhook_cache:
+            value = redis_client.get(key)
+            if value is not None:
+                return value
+        except redis.RedisError as e:
+            mark_redis_down('read', key, e)
+    return local_cache_get(key)
+
+def cache_set(key, value, ttl=None):
+    cache_set_many({key: value}, ttl)
+
+def cache_set_many(mapping, ttl=None):
+    for key, value in mapping.items():
+        local_cache_set(key, value, ttl)
+    if not redis_available():
+        return
+    try:
+        with redis_client.pipeline(transaction=False) as pipe:
+            for key, value in mapping.items():
+                pipe.set(key, value, ex=ttl)
+            pipe.execute()
+    except redis.RedisError as e:
+        mark_redis_down('write', ', '.join(mapping), e)
+
+def detect_new_sales(sales_data):
+    """Return every officer whose demo count rose since the previous poll, in any worker."""
+    current_demos = {entry['name']: entry['demos'] for entry in sales_data if entry['demos'] > 0}
+
+    def swap_snapshot(pipe):
+        # Replace the snapshot so officers whose counts reset (e.g. a new month) start from zero
+        previous = {name.decode(): int(demos) for name, demos in pipe.hgetall(LAST_DEMOS_KEY).items()}
+        pipe.multi()
+        pipe.delete(LAST_DEMOS_KEY)
+        if current_demos:
+            pipe.hset(LAST_DEMOS_KEY, mapping=current_demos)
+        return previous
+
+    previous_demos = None
+    if redis_available():
+        try:
+            # WATCH makes read-and-replace atomic; a concurrent poll forces a retry
+            previous_demos = redis_client.transaction(swap_snapshot, LAST_DEMOS_KEY, value_from_callable=True)
+        except redis.RedisError as e:
+            mark_redis_down('transaction', LAST_DEMOS_KEY, e)
+    if previous_demos is None:
+        # Compare against this worker's snapshot when the shared one could not be swapped
+        previous_demos = dict(last_sale_timestamp)
+
+    last_sale_timestamp.clear()
+    last_sale_timestamp.update(current_demos)
+    return [name for name, demos in current_demos.items() if previous_demos.get(name, 0) < demos]
+
+def fetch_webhook_data(use_cache=True):
+    # Return cached data if still valid
+    cached = cache_get(WEBHOOK_CACHE_KEY) if use_cache else None
+    if cached:
+        logger.debug("Returning cached webhook data")
+        return orjson.loads(cached)
+
+    try:
+        logger.info("Fetching webhook data")
+        response = _SESSION.get(WEBHOOK_URL, timeout=WEBHOOK_TIMEOUT)
+        response.raise_for_status()
+
+        webhook_data = orjson.loads(response.content)
+        cache_set(WEBHOOK_CACHE_KEY, response.content, WEBHOOK_CACHE_TTL)
+        cache_set(WEBHOOK_STALE_KEY, response.content)
+
+        logger.info(f"Successfully fetched webhook data. Status code: {response.status_code}")
+        return webhook_data
+
+    except requests.exceptions.Timeout as e:
+        logger.error(f"Timeout error fetching webhook data: {str(e)}")
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Request error fetching webhook data: {str(e)}")
+    except ValueError as e:
+        logger.error(f"JSON decode error fetching webhook data: {str(e)}")
+
+    stale = cache_get(WEBHOOK_STALE_KEY)
+    if stale:
         logger.warning("Using cached data after all retries failed")
-        return webhook_cache
-        
+        return orjson.loads(stale)
+
     logger.error("All webhook fetch attempts failed")
     return None
 
+def build_endpoint_data(aggregates):
+    """Map each /api endpoint name to its JSON-serializable aggregate."""
+    return {
+        'leadsource': aggregates.leadsource,
+        'admin_monthly_revenue': aggregates.monthly_sales,
+        'monthly_revenue_enrollments': aggregates.monthly_revenue,
+        'daily_enrollments': aggregates.daily,
+        'enrollments_per_opener': aggregates.opener,
+        # Convert sets to lists for JSON serialization
+        'initial_payments': {
+            name: {'count': officer['count'], 'cases': list(officer['cases'])}
+            for name, officer in aggregates.initial_payments.items()
+        }
+    }
+
+def refresh_webhook_cache(use_cache=True):
+    """Rebuild every endpoint's cached JSON from the webhook payload in one pass."""
+    webhook_data = fetch_webhook_data(use_cache=use_cache)
+    if not webhook_data:
+        return None
+
+    now = g.now_pacific if has_request_context() else None
+    endpoint_blobs = {
+        endpoint: orjson.dumps(result)
+        for endpoint, result in build_endpoint_data(process_all(webhook_data, now=now)).items()
+    }
+    cache_set_many(
+        {WEBHOOK_PARSED_KEY.format(endpoint): blob for endpoint, blob in endpoint_blobs.items()},
+        WEBHOOK_CACHE_TTL
+    )
+    return endpoint_blobs
+
+def get_webhook_blob(name):
+    """Return the serialized JSON for an endpoint, cached so repeat polls skip processing.
+
+    The Celery beat task in tasks.py keeps these keys warm; a miss only happens
+    when the worker is not running, in which case the request rebuilds them inline.
+    """
+    cached = cache_get(WEBHOOK_PARSED_KEY.format(name))
+    if cached:
+        return cached
+
+    endpoint_blobs = refresh_webhook_cache()
+    return endpoint_blobs[name] if endpoint_blobs else None
+
+def get_processed_webhook_data(name):
+    blob = get_webhook_blob(name)
+    return orjson.loads(blob) if blob is not None else None
+
+def cached_webhook_view(name):
+    """Build a view that serves the cached JSON for a processed webhook endpoint."""
+    def view():
+        blob = get_webhook_blob(name)
+        if blob is None:
+            app.logger.error("Failed to fetch webhook data")
+            return jsonify({"error": "Failed to fetch data"}), 500
+        return Response(blob, mimetype='application/json')
+    return view
+
+@app.before_request
+def set_request_time():
+    # One Pacific "now" per request, shared by every processor it runs
+    g.now_pacific = datetime.now(PACIFIC)
+
 # Error handler for API endpoints
 @app.errorhandler(500)
 def internal_server_error(error):
@@ -150,9 +372,11 @@ def index():
 def login():
     if request.method == 'POST':
         password = request.form['password']
-        logger.debug(f"Login attempt with password: {password}")
         user = User.get_admin()
         if user and user.check_password(password):
+            if user.password_needs_rehash():
+                user.set_password(password)
+                db.session.commit()
             login_user(user)
             logger.debug("Login successful")
             return redirect(url_for('admin_panel'))
@@ -190,6 +414,7 @@ def set_monthly_goal():
         new_goal_entry = MonthlyGoal(goal=new_goal)
         db.session.add(new_goal_entry)
         db.session.commit()
+        MonthlyGoal.cache_goal(new_goal)
 
         return jsonify({
             'success': True,
@@ -207,123 +432,67 @@ def set_monthly_goal():
             'message': 'Error updating monthly goal'
         }), 500
 
-@app.route('/api/leadsource-data')
-def leadsource_data():
-    webhook_data = fetch_webhook_data()
-    if webhook_data:
-        leadsource_sales = process_leadsource_data(webhook_data)
-        return jsonify(leadsource_sales)
-    else:
-        app.logger.error("Failed to fetch webhook data")
-        return jsonify({"error": "Failed to fetch data"}), 500
+# (rule, endpoint, processed webhook endpoint) served straight from the cache
+WEBHOOK_ROUTES = [
+    ('/api/leadsource-data', 'leadsource_data', 'leadsource'),
+    ('/api/admin-monthly-revenue', 'admin_monthly_revenue', 'admin_monthly_revenue'),
+    ('/api/daily-enrollments', 'daily_enrollments', 'daily_enrollments'),
+    ('/api/enrollments-per-opener', 'enrollments_per_opener', 'enrollments_per_opener'),
+    ('/api/initial-payments', 'initial_payments', 'initial_payments'),
+    ('/api/monthly-revenue-data', 'monthly_revenue_data', 'monthly_revenue_enrollments'),
+]
+
+for rule, endpoint, name in WEBHOOK_ROUTES:
+    app.add_url_rule(rule, endpoint, cached_webhook_view(name))
 
 @app.route('/api/dashboard-data')
 def dashboard_data():
-    global last_processed_officer, last_sale_timestamp
-    webhook_data = fetch_webhook_data()
-    if webhook_data:
-        sales_data = process_admin_monthly_revenue(webhook_data)
-
-        for data in sales_data:
-            db_entry = SalesData(
-                name=data['name'],
-                value=data['value'],
-                demos=data['demos']
+    sales_data = get_processed_webhook_data('admin_monthly_revenue')
+    if sales_data is not None:
+        if sales_data:
+            # Upsert every officer in a single round-trip
+            rows = [{'name': data['name'], 'value': data['value'], 'demos': data['demos']} for data in sales_data]
+            stmt = insert(SalesData).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['name'],
+                set_={'value': stmt.excluded.value, 'demos': stmt.excluded.demos}
             )
-            db.session.merge(db_entry)
-        db.session.commit()
+            db.session.execute(stmt)
+            db.session.commit()
 
-        new_enrollments = sorted(sales_data, key=lambda x: x['demos'], reverse=True)[:3]
-        monthly_revenue = sorted(sales_data, key=lambda x: x['value'], reverse=True)
+        new_enrollments = nlargest(3, sales_data, key=itemgetter('demos'))
+        monthly_revenue = sorted(sales_data, key=itemgetter('value'), reverse=True)
         upcoming_demos = sum(rep['demos'] for rep in sales_data)
         current_goal = MonthlyGoal.get_current_goal()
 
-        new_sales_officer = None
-        if sales_data:
-            for entry in sales_data:
-                officer_name = entry['name']
-                last_sale_demos = last_sale_timestamp.get(officer_name, 0)
-
-                if entry['demos'] > 0 and entry['demos'] != last_sale_demos:
-                    new_sales_officer = officer_name
-                    last_processed_officer = officer_name
-                    last_sale_timestamp[officer_name] = entry['demos']
-                    app.logger.info(f"New sale detected for: {new_sales_officer}")
-                    break
+        new_sales_officers = detect_new_sales(sales_data)
+        new_sales_officer = new_sales_officers[0] if new_sales_officers else None
+        if new_sales_officers:
+            app.logger.info(f"New sale detected for: {', '.join(new_sales_officers)}")
 
         response_data = {
             "new_enrollments": new_enrollments,
             "monthly_revenue": monthly_revenue,
             "upcoming_demos": upcoming_demos,
             "monthly_goal": current_goal,
-            "new_sales_officer": new_sales_officer
+            "new_sales_officer": new_sales_officer,
+            "new_sales_officers": new_sales_officers
         }
         return jsonify(response_data)
     else:
         app.logger.error("Failed to fetch webhook data")
         return jsonify({"error": "Failed to fetch data"}), 500
 
-@app.route('/api/admin-monthly-revenue')
-def admin_monthly_revenue():
-    webhook_data = fetch_webhook_data()
-    if webhook_data:
-        monthly_revenue = process_admin_monthly_revenue(webhook_data)
-        return jsonify(monthly_revenue)
-    else:
-        app.logger.error("Failed to fetch webhook data")
-        return jsonify({"error": "Failed to fetch data"}), 500
-
-@app.route('/api/daily-enrollments')
-def daily_enrollments():
-    webhook_data = fetch_webhook_data()
-    if webhook_data:
-        daily_data = process_daily_enrollments(webhook_data)
-        return jsonify(daily_data)
-    else:
-        app.logger.error("Failed to fetch webhook data")
-        return jsonify({"error": "Failed to fetch data"}), 500
-
-@app.route('/api/enrollments-per-opener')
-def enrollments_per_opener():
-    webhook_data = fetch_webhook_data()
-    if webhook_data:
-        opener_data = process_enrollments_per_opener(webhook_data)
-        return jsonify(opener_data)
-    else:
-        app.logger.error("Failed to fetch webhook data")
-        return jsonify({"error": "Failed to fetch data"}), 500
-
 @app.route('/static/videos/<path:filename>')
 def serve_video(filename):
-    video_path = os.path.join('static/videos', filename)
-    if os.path.exists(video_path):
-        return send_from_directory('static/videos', filename, mimetype=mimetypes.guess_type(filename)[0])
-    else:
-        app.logger.error(f"Video file not found: {video_path}")
-        return "Video not found", 404
-
-@app.route('/api/initial-payments')
-def initial_payments():
-    webhook_data = fetch_webhook_data()
-    if webhook_data:
-        payments_data = process_initial_payments(webhook_data)
-        # Convert sets to lists for JSON serialization
-        for officer in payments_data.values():
-            officer['cases'] = list(officer['cases'])
-        return jsonify(payments_data)
-    else:
-        app.logger.error("Failed to fetch webhook data")
-        return jsonify({"error": "Failed to fetch data"}), 500
-
-@app.route('/api/monthly-revenue-data')
-def monthly_revenue_data():
-    webhook_data = fetch_webhook_data()
-    if webhook_data:
-        monthly_revenue = process_monthly_revenue_enrollments(webhook_data)
-        return jsonify(monthly_revenue)
-    else:
-        app.logger.error("Failed to fetch webhook data")
-        return jsonify({"error": "Failed to fetch data"}), 500
+    # send_from_directory raises NotFound for missing files and answers conditional/Range requests
+    return send_from_directory(
+        'static/videos', filename,
+        mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+        conditional=True,
+        etag=True,
+        max_age=VIDEO_CACHE_MAX_AGE
+    )
 
 if __name__ == '__main__':
     with app.app_context():
@@ -340,4 +509,4 @@ if __name__ == '__main__':
             logger.error(f"Database initialization error: {str(e)}")
     
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port, debug=DEBUG)
\ No newline at end of file
@@ -1,217 +1,174 @@
-from datetime import datetime, timedelta
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+import ciso8601
 import pytz
 import logging
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-def process_daily_enrollments(data):
-    """Process daily enrollments data from webhook responses."""
-    pacific_tz = pytz.timezone('America/Los_Angeles')
-    current_date = datetime.now(pacific_tz).date()
-    daily_enrollments = {}
+PACIFIC = pytz.timezone('America/Los_Angeles')
+ONE_DAY = timedelta(days=1)
+# Strips currency formatting from payment amounts in a single pass
+_MONEY = str.maketrans('', '', '$, ')
 
+def _empty_daily_counts(current_date):
+    """Zero counts keyed by date for the last 10 weekdays, each shifted forward one day."""
+    daily_counts = {}
     for i in range(14):
         day = current_date - timedelta(days=i)
         if day.weekday() < 5:  # Only include weekdays
-            daily_enrollments[(day + timedelta(days=1)).strftime("%Y-%m-%d")] = 0
-        if len(daily_enrollments) == 10:
+            daily_counts[day + ONE_DAY] = 0
+        if len(daily_counts) == 10:
             break
+    return daily_counts
+
+def _month_bounds(now):
+    """UTC start (inclusive) and end (exclusive) of the Pacific month containing now."""
+    month_start = datetime(now.year, now.month, 1)
+    next_month = datetime(now.year + now.month // 12, now.month % 12 + 1, 1)
+    return (PACIFIC.localize(month_start).astimezone(timezone.utc),
+            PACIFIC.localize(next_month).astimezone(timezone.utc))
+
+def _day_starts(first_day, last_day):
+    """UTC start of each Pacific day from first_day through the day after last_day."""
+    return [PACIFIC.localize(datetime(day.year, day.month, day.day)).astimezone(timezone.utc)
+            for day in (first_day + timedelta(days=i) for i in range((last_day - first_day).days + 2))]
+
+def _is_yes(value):
+    """True for a 'yes' flag in any case; None and non-string values are not 'yes'."""
+    return str(value).lower() == 'yes'
+
+def _format_daily_counts(daily_counts):
+    """Newest-first list of {date, count} dicts; dates are only formatted here."""
+    return [{"date": day.strftime("%Y-%m-%d"), "count": count}
+            for day, count in sorted(daily_counts.items(), reverse=True)]
+
+@dataclass
+class WebhookAggregates:
+    """All webhook aggregates for the current month, built in a single pass."""
+    monthly_sales: list
+    initial_payments: dict
+    opener: list
+    daily: list
+    leadsource: dict
+
+    @property
+    def monthly_revenue(self):
+        """Monthly revenue per officer with demos taken from initial payments."""
+        return [
+            {
+                'name': officer['name'],
+                'value': officer['value'],
+                'demos': self.initial_payments.get(officer['name'], {}).get('count', 0)
+            }
+            for officer in self.monthly_sales
+        ]
+
+def process_all(data, now=None):
+    """Process webhook data for every dashboard aggregate in one pass over the entries."""
+    now = now or datetime.now(PACIFIC)
+    current_date = now.date()
+    month_start, month_end = _month_bounds(now)
+
+    daily_enrollments = _empty_daily_counts(current_date)
+    # Entries are bucketed by comparing UTC timestamps against each Pacific day's start
+    first_day = min(daily_enrollments) - ONE_DAY
+    day_starts = _day_starts(first_day, current_date)
+    buckets_start, buckets_end = day_starts[0], day_starts[-1]
 
-    for entry in data:
-        try:
-            timestamp_str = entry['timestamp']
-            if timestamp_str.endswith('Z'):
-                timestamp_str = timestamp_str[:-1] + '+00:00'
-            timestamp = datetime.fromisoformat(timestamp_str).astimezone(pacific_tz)
-            date_key = (timestamp.date() + timedelta(days=1)).strftime("%Y-%m-%d")
-            
-            if date_key in daily_enrollments:
-                lead_sales = entry['data'].get('Leadsales', 'no')
-                if lead_sales.lower() == 'yes':
-                    daily_enrollments[date_key] += 1
-        except Exception as e:
-            logger.error(f"Error processing webhook data entry for daily enrollments: {str(e)}")
-
-    sorted_data = [{"date": date, "count": count} for date, count in daily_enrollments.items()]
-    sorted_data.sort(key=lambda x: x['date'], reverse=True)
-    return sorted_data[:10]
-
-def process_leadsource_data(data):
-    """Process lead source data from webhook responses."""
-    current_month = datetime.now(pytz.timezone('America/Los_Angeles')).month
+    monthly_sales = {}
+    payments = {}
+    opener_enrollments = {}
     leadsource_sales = {}
 
     for entry in data:
         try:
-            timestamp = datetime.strptime(entry['timestamp'], "%Y-%m-%dT%H:%M:%S.%f%z").astimezone(pytz.timezone('America/Los_Angeles'))
-            if timestamp.month == current_month:
-                lead_sales = entry['data'].get('Leadsales', 'no')
-                lead_source = entry['data'].get('Leadsource', '')
-
-                if lead_sales.lower() == 'yes' and lead_source:
-                    if lead_source not in leadsource_sales:
-                        leadsource_sales[lead_source] = 0
-                    leadsource_sales[lead_source] += 1
+            webhook_data = entry['data']
+            timestamp = ciso8601.parse_datetime(entry['timestamp'])
+            if timestamp.tzinfo is None:
+                timestamp = timestamp.astimezone()  # Naive timestamps are server local time
+            fields = (webhook_data.get('SetOfficerName') or '', webhook_data.get('Leadsales'),
+                      webhook_data.get('InitialPayment'), webhook_data.get('CaseID'),
+                      webhook_data.get('Paymentamount') or '0',
+                      webhook_data.get('Leadsource'), webhook_data.get('OpenerName'))
         except Exception as e:
-            logger.error(f"Error processing webhook data entry for lead source: {str(e)}")
+            logger.debug("Error processing webhook data entry: %s", e)
+            continue
 
-    return leadsource_sales
+        # Field values are coerced so a malformed one only affects the aggregate that reads it
+        officer_name, lead_sales, initial_payment, case_id, payment_amount, lead_source, opener_name = fields
+        is_lead_sale = _is_yes(lead_sales)
 
-def process_admin_monthly_revenue(data):
-    """Process webhook data for monthly revenue in admin panel."""
-    current_month = datetime.now(pytz.timezone('America/Los_Angeles')).month
-    monthly_sales = {}
+        if buckets_start <= timestamp < buckets_end:
+            # bisect_right is the entry's day offset plus one, matching the shifted keys
+            day = first_day + timedelta(days=bisect_right(day_starts, timestamp))
+            count = daily_enrollments.get(day)
+            if count is not None:
+                daily_enrollments[day] = count + is_lead_sale
 
-    for entry in data:
-        try:
-            timestamp = datetime.strptime(entry['timestamp'], "%Y-%m-%dT%H:%M:%S.%f%z").astimezone(pytz.timezone('America/Los_Angeles'))
-            if timestamp.month == current_month:
-                officer_name = entry['data'].get('SetOfficerName', '')
-                lead_sales = entry['data'].get('Leadsales', 'no')
-                payment_amount = entry['data'].get('Paymentamount', '0')
-
-                if officer_name not in monthly_sales:
-                    monthly_sales[officer_name] = {
-                        'name': officer_name,
-                        'value': 0.0,
-                        'demos': 0
-                    }
-
-                if lead_sales.lower() == 'yes':
-                    monthly_sales[officer_name]['demos'] += 1
-
-                if payment_amount:
-                    try:
-                        amount = float(payment_amount.strip('$').replace(',', ''))
-                        monthly_sales[officer_name]['value'] += amount
-                    except ValueError:
-                        logger.warning(f"Invalid payment amount: {payment_amount}")
-        except Exception as e:
-            logger.error(f"Error processing webhook data entry for monthly sales: {str(e)}")
+        in_month = month_start <= timestamp < month_end
+        if in_month and _is_yes(initial_payment) and officer_name and case_id:
+            if officer_name not in payments:
+                payments[officer_name] = {
+                    'count': 0,
+                    'cases': set()
+                }
+            if case_id not in payments[officer_name]['cases']:
+                payments[officer_name]['count'] += 1
+                payments[officer_name]['cases'].add(case_id)
 
-    return list(monthly_sales.values())
+        # Skip if not in current month
+        if not in_month:
+            continue
 
-def process_monthly_revenue_enrollments(data):
-    """Process webhook data for monthly revenue with initial payments data."""
-    current_month = datetime.now(pytz.timezone('America/Los_Angeles')).month
-    monthly_sales = {}
+        if officer_name not in monthly_sales:
+            monthly_sales[officer_name] = {
+                'name': officer_name,
+                'value': 0.0,
+                'demos': 0
+            }
+
+        if is_lead_sale:
+            monthly_sales[officer_name]['demos'] += 1
+            if lead_source:
+                leadsource_sales[lead_source] = leadsource_sales.get(lead_source, 0) + 1
+            if opener_name:
+                opener_enrollments[opener_name] = opener_enrollments.get(opener_name, 0) + 1
 
-    for entry in data:
         try:
-            timestamp = datetime.strptime(entry['timestamp'], "%Y-%m-%dT%H:%M:%S.%f%z").astimezone(pytz.timezone('America/Los_Angeles'))
-            if timestamp.month == current_month:
-                officer_name = entry['data'].get('SetOfficerName', '')
-                payment_amount = entry['data'].get('Paymentamount', '0')
-
-                if officer_name not in monthly_sales:
-                    monthly_sales[officer_name] = {
-                        'name': officer_name,
-                        'value': 0.0,
-                        'demos': 0
-                    }
-
-                if payment_amount:
-                    try:
-                        amount = float(payment_amount.strip('$').replace(',', ''))
-                        monthly_sales[officer_name]['value'] += amount
-                    except ValueError:
-                        logger.warning(f"Invalid payment amount: {payment_amount}")
-        except Exception as e:
-            logger.error(f"Error processing webhook data entry for monthly sales: {str(e)}")
+            monthly_sales[officer_name]['value'] += float(str(payment_amount).translate(_MONEY))
+        except ValueError:
+            logger.debug("Invalid payment amount: %s", payment_amount)
+
+    return WebhookAggregates(
+        monthly_sales=list(monthly_sales.values()),
+        initial_payments=payments,
+        opener=sorted(opener_enrollments.items(), key=lambda x: x[1], reverse=True),
+        daily=_format_daily_counts(daily_enrollments),
+        leadsource=leadsource_sales
+    )
+
+def process_daily_enrollments(data, now=None):
+    """Process daily enrollments data from webhook responses."""
+    return process_all(data, now).daily
 
-    # Get initial payments data and update demos count
-    payments_data = process_initial_payments(data)
-    for officer in monthly_sales.values():
-        if officer['name'] in payments_data:
-            officer['demos'] = payments_data[officer['name']]['count']
+def process_leadsource_data(data, now=None):
+    """Process lead source data from webhook responses."""
+    return process_all(data, now).leadsource
 
-    return list(monthly_sales.values())
+def process_admin_monthly_revenue(data, now=None):
+    """Process webhook data for monthly revenue in admin panel."""
+    return process_all(data, now).monthly_sales
 
-def process_initial_payments(data):
+def process_monthly_revenue_enrollments(data, now=None):
+    """Process webhook data for monthly revenue with initial payments data."""
+    return process_all(data, now).monthly_revenue
+
+def process_initial_payments(data, now=None):
     """Process webhook data for initial payments tracking."""
-    pacific_tz = pytz.timezone('America/Los_Angeles')
-    current_month = datetime.now(pacific_tz).month
-    payments = {}
-    
-    for entry in data:
-        try:
-            webhook_data = entry['data']
-            
-            # Skip if not an initial payment
-            if webhook_data.get('InitialPayment', 'no').lower() != 'yes':
-                continue
-                
-            # Skip if not in current month
-            timestamp = datetime.strptime(entry['timestamp'], "%Y-%m-%dT%H:%M:%S.%f%z")
-            if timestamp.month != current_month:
-                continue
-                
-            # Extract required fields
-            officer_name = webhook_data.get('SetOfficerName')
-            case_id = webhook_data.get('CaseID')
-            
-            # Skip if missing required fields
-            if not all([officer_name, case_id]):
-                continue
-                
-            # Initialize officer data if needed
-            if officer_name not in payments:
-                payments[officer_name] = {
-                    'count': 0,
-                    'cases': set()
-                }
-                
-            # Skip duplicate case IDs
-            if case_id in payments[officer_name]['cases']:
-                continue
-                
-            # Track the payment
-            payments[officer_name]['count'] += 1
-            payments[officer_name]['cases'].add(case_id)
-                
-        except Exception as e:
-            logger.error(f"Error processing payment: {str(e)}")
-            continue
-            
-    return payments
+    return process_all(data, now).initial_payments
 
-def process_enrollments_per_opener(data):
+def process_enrollments_per_opener(data, now=None):
     """Process webhook data for enrollments per opener section."""
-    pacific_tz = pytz.timezone('America/Los_Angeles')
-    current_month = datetime.now(pacific_tz).month
-    opener_enrollments = {}
-    
-    for entry in data:
-        try:
-            webhook_data = entry['data']
-            timestamp = datetime.strptime(entry['timestamp'], "%Y-%m-%dT%H:%M:%S.%f%z").astimezone(pacific_tz)
-            
-            # Skip if not in current month
-            if timestamp.month != current_month:
-                continue
-                
-            # Skip if not a lead sale
-            if webhook_data.get('Leadsales', 'no').lower() != 'yes':
-                continue
-                
-            # Get opener name
-            opener_name = webhook_data.get('OpenerName', '')
-            if not opener_name:
-                continue
-                
-            # Initialize opener data if needed
-            if opener_name not in opener_enrollments:
-                opener_enrollments[opener_name] = 0
-                
-            # Count the enrollment
-            opener_enrollments[opener_name] += 1
-                
-        except Exception as e:
-            logger.error(f"Error processing opener enrollment: {str(e)}")
-            continue
-    
-    # Convert to sorted list of tuples (opener_name, count)
-    sorted_opener_data = sorted(opener_enrollments.items(), key=lambda x: x[1], reverse=True)
-    return sorted_opener_data
+    return process_all(data, now).opener
@@ -1,5 +1,5 @@
 import os
-from app import app, db, User
+from app import app, db, User, DEBUG
 import unittest
 
 def create_admin_user():
@@ -34,4 +34,4 @@ if __name__ == "__main__":
     # Start the Flask application regardless of test results
     print("Starting the Flask application...")
     port = int(os.environ.get('PORT', 5000))
-    app.run(host="0.0.0.0", port=port, debug=True)
+    app.run(host="0.0.0.0", port=port, debug=DEBUG)
@@ -3,5 +3,6 @@
     pkgs.ffmpeg
     pkgs.openssl
     pkgs.postgresql
+    pkgs.redis
   ];
 }
@@ -0,0 +1,22 @@
+from celery import Celery
+import logging
+from app import REDIS_URL, WEBHOOK_REFRESH_INTERVAL, refresh_webhook_cache as rebuild_webhook_cache
+
+logger = logging.getLogger(__name__)
+
+celery_app = Celery('leaderboard', broker=REDIS_URL)
+celery_app.conf.beat_schedule = {
+    'refresh-webhook-cache': {
+        'task': 'tasks.refresh_webhook_cache',
+        'schedule': WEBHOOK_REFRESH_INTERVAL,
+        # Drop runs that queue up behind a slow upstream instead of piling them up
+        'options': {'expires': WEBHOOK_REFRESH_INTERVAL},
+    }
+}
+celery_app.conf.task_ignore_result = True
+
+@celery_app.task
+def refresh_webhook_cache():
+    """Poll the webhook receiver and store pre-processed data for every API endpoint."""
+    if rebuild_webhook_cache(use_cache=False) is None:
+        logger.error("Failed to refresh webhook cache")
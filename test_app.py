@@ -1,6 +1,16 @@
 import unittest
+from unittest import mock
 from datetime import datetime, timedelta
-from app import app, process_daily_enrollments
+import orjson
+import pytz
+import redis
+import requests
+from werkzeug.security import generate_password_hash
+import app as app_module
+from app import app
+from enrollment_processors import (
+    _month_bounds, process_all, process_daily_enrollments, process_leadsource_data, PACIFIC
+)
 
 class TestDailyEnrollments(unittest.TestCase):
     def setUp(self):
@@ -59,5 +69,196 @@ class TestDailyEnrollments(unittest.TestCase):
             self.assertIn('date', item)
             self.assertIn('count', item)
 
+class TestProcessAll(unittest.TestCase):
+    def setUp(self):
+        self.now = PACIFIC.localize(datetime(2024, 5, 15, 12))
+        self.mock_data = [
+            {
+                'timestamp': '2024-05-15T10:00:00.000000+00:00',
+                'data': {'Leadsales': 'yes', 'SetOfficerName': 'Alice', 'Paymentamount': '$1,200.50',
+                         'Leadsource': 'Web', 'OpenerName': 'Bob', 'InitialPayment': 'yes', 'CaseID': '1'}
+            },
+            {
+                'timestamp': '2024-05-15T10:00:00.000000+00:00',
+                'data': {'Leadsales': 'no', 'SetOfficerName': 'Alice', 'Paymentamount': '300',
+                         'InitialPayment': 'yes', 'CaseID': '1'}
+            },
+            {
+                'timestamp': '2024-05-15T10:00:00.000000+00:00',
+                'data': {'Leadsales': 'yes', 'SetOfficerName': 'Carol', 'Paymentamount': 'n/a',
+                         'Leadsource': 'Radio', 'OpenerName': 'Bob'}
+            },
+            {
+                'timestamp': '2024-04-05T10:00:00.000000+00:00',
+                'data': {'Leadsales': 'yes', 'SetOfficerName': 'Alice', 'Paymentamount': '999',
+                         'Leadsource': 'Web', 'OpenerName': 'Dan', 'InitialPayment': 'yes', 'CaseID': '2'}
+            },
+            # Malformed fields must only affect the aggregates that read them
+            {
+                'timestamp': '2024-05-15T10:00:00.000000+00:00',
+                'data': {'Leadsales': 'yes', 'SetOfficerName': 'Dave', 'Paymentamount': 1200,
+                         'Leadsource': 'Web', 'OpenerName': 'Erin'}
+            },
+            {
+                'timestamp': '2024-05-15T10:00:00.000000+00:00',
+                'data': {'Leadsales': None, 'SetOfficerName': 'Frank', 'Paymentamount': '$50',
+                         'InitialPayment': 'yes', 'CaseID': '3'}
+            },
+            {'timestamp': 'not a timestamp', 'data': {'Leadsales': 'yes', 'SetOfficerName': 'Gina'}}
+        ]
+
+    def test_aggregates(self):
+        aggregates = process_all(self.mock_data, now=self.now)
+
+        self.assertEqual(aggregates.monthly_sales, [
+            {'name': 'Alice', 'value': 1500.5, 'demos': 1},
+            {'name': 'Carol', 'value': 0.0, 'demos': 1},
+            {'name': 'Dave', 'value': 1200.0, 'demos': 1},
+            {'name': 'Frank', 'value': 50.0, 'demos': 0}
+        ])
+        self.assertEqual(aggregates.monthly_revenue, [
+            {'name': 'Alice', 'value': 1500.5, 'demos': 1},
+            {'name': 'Carol', 'value': 0.0, 'demos': 0},
+            {'name': 'Dave', 'value': 1200.0, 'demos': 0},
+            {'name': 'Frank', 'value': 50.0, 'demos': 1}
+        ])
+        self.assertEqual(aggregates.initial_payments, {
+            'Alice': {'count': 1, 'cases': {'1'}},
+            'Frank': {'count': 1, 'cases': {'3'}}
+        })
+        self.assertEqual(aggregates.leadsource, {'Web': 2, 'Radio': 1})
+        self.assertEqual(aggregates.opener, [('Bob', 2), ('Erin', 1)])
+        # 2024-05-15 is counted under the next day's key
+        self.assertIn({'date': '2024-05-16', 'count': 3}, aggregates.daily)
+
+    def test_now_selects_month(self):
+        last_month = self.now - timedelta(days=40)
+        self.assertEqual(process_leadsource_data(self.mock_data, now=last_month), {'Web': 1})
+
+    def test_month_bounds_roll_over_december(self):
+        start, end = _month_bounds(PACIFIC.localize(datetime(2024, 12, 15, 12)))
+        self.assertEqual(start, datetime(2024, 12, 1, 8, tzinfo=pytz.utc))
+        self.assertEqual(end, datetime(2025, 1, 1, 8, tzinfo=pytz.utc))
+
+    def test_month_starts_at_pacific_midnight(self):
+        entries = [
+            {'timestamp': timestamp, 'data': {'Leadsales': 'yes', 'Leadsource': source}}
+            for timestamp, source in [
+                ('2024-05-01T06:59:59+00:00', 'April'),  # 23:59:59 PDT on April 30
+                ('2024-05-01T07:00:00+00:00', 'May'),  # midnight PDT on May 1
+                ('2024-06-01T06:59:59+00:00', 'May'),
+                ('2024-06-01T07:00:00+00:00', 'June'),
+            ]
+        ]
+        self.assertEqual(process_leadsource_data(entries, now=self.now), {'May': 2})
+
+    def test_day_starts_at_pacific_midnight(self):
+        entries = [
+            {'timestamp': timestamp, 'data': {'Leadsales': 'yes'}}
+            for timestamp in [
+                '2024-05-14T06:59:59+00:00',  # 23:59:59 PDT on May 13
+                '2024-05-14T07:00:00+00:00',  # midnight PDT on May 14
+                '2024-05-15T06:59:59+00:00',
+            ]
+        ]
+        counts = {row['date']: row['count'] for row in process_daily_enrollments(entries, now=self.now)}
+        self.assertEqual(counts['2024-05-14'], 1)
+        self.assertEqual(counts['2024-05-15'], 2)
+
+    def test_initial_payments_ignore_prior_year(self):
+        entries = [
+            {'timestamp': timestamp, 'data': {'SetOfficerName': 'Alice', 'Paymentamount': '100',
+                                              'InitialPayment': 'yes', 'CaseID': case_id}}
+            for timestamp, case_id in [('2024-05-10T12:00:00+00:00', '1'), ('2023-05-10T12:00:00+00:00', '2')]
+        ]
+        self.assertEqual(process_all(entries, now=self.now).monthly_revenue,
+                         [{'name': 'Alice', 'value': 100.0, 'demos': 1}])
+
+class TestWebhookCacheWithoutRedis(unittest.TestCase):
+    API_ROUTES = [
+        '/api/leadsource-data', '/api/admin-monthly-revenue', '/api/daily-enrollments',
+        '/api/enrollments-per-opener', '/api/initial-payments', '/api/monthly-revenue-data',
+        '/api/leadsource-data', '/api/daily-enrollments'
+    ]
+
+    def setUp(self):
+        self.client = app.test_client()
+        payload = [{
+            'timestamp': datetime.now(pytz.utc).isoformat(),
+            'data': {'Leadsales': 'yes', 'SetOfficerName': 'Alice', 'Paymentamount': '$10',
+                     'Leadsource': 'Web', 'OpenerName': 'Bob', 'InitialPayment': 'yes', 'CaseID': '1'}
+        }]
+        self.response = mock.Mock(status_code=200, content=orjson.dumps(payload))
+        app_module._local_cache.clear()
+        patcher = mock.patch('app.redis_available', return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(app_module._local_cache.clear)
+
+    def test_routes_share_one_upstream_fetch(self):
+        with mock.patch.object(app_module._SESSION, 'get', return_value=self.response) as get:
+            for route in self.API_ROUTES:
+                self.assertEqual(self.client.get(route).status_code, 200, route)
+        self.assertEqual(get.call_count, 1)
+
+    def test_stale_payload_served_when_upstream_fails(self):
+        with mock.patch.object(app_module._SESSION, 'get', return_value=self.response):
+            self.assertEqual(self.client.get('/api/leadsource-data').status_code, 200)
+
+        # Expire everything except the stale copy
+        for key in list(app_module._local_cache):
+            if key != app_module.WEBHOOK_STALE_KEY:
+                del app_module._local_cache[key]
+
+        with mock.patch.object(app_module._SESSION, 'get', side_effect=requests.exceptions.ConnectionError):
+            response = self.client.get('/api/leadsource-data')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {'Web': 1})
+
+class TestDetectNewSales(unittest.TestCase):
+    def setUp(self):
+        app_module.last_sale_timestamp.clear()
+        self.addCleanup(app_module.last_sale_timestamp.clear)
+
+    def poll(self, **demos):
+        return app_module.detect_new_sales([{'name': name, 'demos': count} for name, count in demos.items()])
+
+    def assert_reports_each_sale_once(self):
+        self.assertEqual(self.poll(Alice=1, Bob=0), ['Alice'])
+        self.assertEqual(self.poll(Alice=1, Bob=0), [])
+        self.assertEqual(self.poll(Alice=1, Bob=2), ['Bob'])
+
+    def test_without_redis(self):
+        with mock.patch('app.redis_available', return_value=False):
+            self.assert_reports_each_sale_once()
+
+    def test_failed_swap_falls_back_to_local_snapshot(self):
+        with mock.patch('app.redis_available', return_value=True), \
+                mock.patch('app.mark_redis_down') as mark_down, \
+                mock.patch.object(app_module.redis_client, 'transaction', side_effect=redis.ConnectionError):
+            self.assert_reports_each_sale_once()
+        self.assertEqual(mark_down.call_count, 3)
+
+class TestPasswordMigration(unittest.TestCase):
+    def setUp(self):
+        self.user = app_module.User(id=1, username='admin', password_hash=generate_password_hash('secret'))
+
+    def test_legacy_hash_verifies(self):
+        self.assertTrue(self.user.check_password('secret'))
+        self.assertFalse(self.user.check_password('wrong'))
+        self.assertTrue(self.user.password_needs_rehash())
+
+    def test_login_rehashes_legacy_hash(self):
+        client = app.test_client()
+        with mock.patch.object(app_module.User, 'get_admin', return_value=self.user), \
+                mock.patch.object(app_module.db.session, 'commit') as commit:
+            response = client.post('/login', data={'password': 'secret'})
+        self.assertEqual(response.status_code, 302)
+        commit.assert_called_once()
+        self.assertTrue(self.user.password_hash.startswith('$argon2'))
+        self.assertFalse(self.user.password_needs_rehash())
+        self.assertTrue(self.user.check_password('secret'))
+        self.assertFalse(self.user.check_password('wrong'))
+
 if __name__ == '__main__':
     unittest.main()